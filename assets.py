@@ -0,0 +1,152 @@
+"""
+Build stage for publishing the dynamic webpage: minifies, fingerprints,
+and precompresses the web assets referenced by index.html.
+"""
+
+import fnmatch
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+
+log = logging.getLogger(__name__)
+
+INDEX_FILE = "index.html"
+FINGERPRINT_LENGTH = 10
+REFERENCE_RE = re.compile(r'(href|src)="(resources/[^"]+\.(?:css|js))"')
+FINGERPRINTED_RE = re.compile(
+    r"\.[0-9a-f]{%d}\.(?:css|js)(?:\.gz)?$" % FINGERPRINT_LENGTH
+)
+
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_WHITESPACE_RE = re.compile(r"\s+")
+CSS_PUNCTUATION_RE = re.compile(r"\s*([{};,>])\s*")
+CSS_COLON_RE = re.compile(r":\s+")
+
+
+def content_hash(content):
+    """Returns the hex digest of the given bytes."""
+    return hashlib.sha1(content).hexdigest()
+
+
+def minify_css(text):
+    """Returns the given CSS with comments and insignificant whitespace removed."""
+    text = CSS_COMMENT_RE.sub("", text)
+    text = CSS_WHITESPACE_RE.sub(" ", text)
+    text = CSS_PUNCTUATION_RE.sub(r"\1", text)
+    text = CSS_COLON_RE.sub(":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    """
+    Returns the given JavaScript with indentation, blank lines, and full line
+    comments removed. Line breaks are kept so automatic semicolon insertion
+    still applies.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+def minify(path, text):
+    """Returns minified content of the asset at path, unless already minified."""
+    if ".min." in os.path.basename(path):
+        return text
+    if path.endswith(".css"):
+        return minify_css(text)
+    if path.endswith(".js"):
+        return minify_js(text)
+    return text
+
+
+def fingerprinted(path, content):
+    """Returns the given asset path with a content hash before its extension."""
+    root, ext = os.path.splitext(path)
+    return "{}.{}{}".format(root, content_hash(content)[:FINGERPRINT_LENGTH], ext)
+
+
+def is_fingerprinted(path):
+    """Returns True iff the given path names a fingerprinted asset or its .gz."""
+    return FINGERPRINTED_RE.search(path) is not None
+
+
+def write_asset(path, content):
+    """Writes content to path along with a precompressed path.gz alongside it."""
+    with open(path, "wb") as f:
+        f.write(content)
+    # mtime=0 keeps compressed output, and therefore its hash, deterministic
+    with open(path + ".gz", "wb") as raw:
+        with gzip.GzipFile(os.path.basename(path), "wb", 9, raw, mtime=0) as f:
+            f.write(content)
+
+
+def build(web_dir):
+    """
+    Minifies, fingerprints, and precompresses every asset referenced by the
+    index.html in web_dir, then rewrites index.html to reference them.
+    """
+    index_path = os.path.join(web_dir, INDEX_FILE)
+    with io.open(index_path, "r", encoding="utf-8") as f:
+        index = f.read()
+
+    built = {}
+
+    def rewrite(match):
+        attr, ref = match.groups()
+        if ref not in built:
+            with io.open(os.path.join(web_dir, ref), "r", encoding="utf-8") as f:
+                content = minify(ref, f.read()).encode("utf-8")
+            built[ref] = fingerprinted(ref, content)
+            write_asset(os.path.join(web_dir, built[ref]), content)
+            log.info("built {} -> {}".format(ref, built[ref]))
+        return '{}="{}"'.format(attr, built[ref])
+
+    index = REFERENCE_RE.sub(rewrite, index)
+    write_asset(index_path, index.encode("utf-8"))
+    return built
+
+
+def excluded(path, exclude):
+    """Returns True iff any component of the given path matches an exclude pattern."""
+    parts = path.split(os.sep)
+    return any(fnmatch.fnmatch(part, pattern) for part in parts for pattern in exclude)
+
+
+def file_manifest(root, exclude=[]):
+    """Returns a mapping of relative file path to content hash for files under root."""
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, root)
+            if os.path.islink(path) or excluded(relpath, exclude):
+                continue
+            with open(path, "rb") as f:
+                manifest[relpath] = content_hash(f.read())
+    return manifest
+
+
+def changed_files(manifest, previous):
+    """Returns sorted paths in manifest that are new or changed since previous."""
+    return sorted(k for k, v in manifest.items() if previous.get(k) != v)
+
+
+def load_manifest(filename):
+    """Returns the manifest saved at filename, or None if there is not one."""
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save_manifest(filename, manifest):
+    """Saves manifest to filename."""
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(filename, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
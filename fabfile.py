@@ -4,17 +4,24 @@ Note: Requires fabric<2.0
 
 import logging
 import os
+import re
 import yaml
 
-from fabric.api import lcd, task, local
+from fabric.api import cd, lcd, task, local, run
 from shutil import rmtree
 
+import assets
+
 USE_RSYNC_PROJECT = True
 
 if USE_RSYNC_PROJECT:
     from fabric.api import env
     from fabric.contrib.project import rsync_project
-    from functools import partial
+
+try:  # python 3.3+
+    from shlex import quote
+except ImportError:
+    from pipes import quote
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -23,6 +30,7 @@ log = logging.getLogger()
 repo_root = local("git rev-parse --show-toplevel", capture=True)
 workspace = local("mktemp -d", capture=True)
 conf_file = "deploy.yaml"
+manifest_dir = os.path.join(repo_root, "cache")
 ignore = [".git", "fabfile.py", "cache", "config", "*.log"]
 
 try:
@@ -40,45 +48,130 @@ env.hosts = ["{}@{}:22".format(env.user, host) for host in conf["hosts"]]
 
 def export():
     """Exports repository's master branch to a temporary workspace."""
+    local("mkdir -p " + workspace)
     with lcd(repo_root):
         local("git archive master | tar -x -C " + workspace)
 
 
-def deploy_project(local_dir, remote_dir, exclude=[]):
-    """Deploy the entire project at local_dir to remote_dir, excluding the given paths."""
+def deploy_project(local_dir, remote_dir, exclude=[], build=False):
+    """
+    Deploy the project at local_dir to remote_dir, excluding the given paths.
+    Only files changed since the last deployment to remote_dir are uploaded.
+    """
     export()
 
-    if USE_RSYNC_PROJECT:
-        sync = partial(
-            rsync_project,
-            remote_dir=remote_dir,
-            exclude=exclude,
-            delete=True,
-            extra_opts="-e 'ssh -l {}'".format(conf["user"]),
+    if build:
+        assets.build(os.path.join(workspace, local_dir))
+
+    # paths are relative to the directory each root is synced from
+    roots = [local_dir, "resources"]
+    manifest = {
+        local_dir: assets.file_manifest(os.path.join(workspace, local_dir), exclude),
+        "resources": {
+            os.path.join("resources", path): digest
+            for path, digest in assets.file_manifest(
+                os.path.join(workspace, "resources"), exclude
+            ).items()
+        },
+    }
+    manifest_file = os.path.join(
+        manifest_dir,
+        "deploy-{}.json".format(
+            re.sub(r"[^\w.-]+", "_", env.host_string + remote_dir).strip("_")
+        ),
+    )
+    previous = assets.load_manifest(manifest_file)
+    if previous is not None and "files" not in previous:
+        previous = None  # manifest from before removals were tracked
+
+    # Paths removed since the last deployment are deleted from remote_dir, except
+    # fingerprinted assets, which are kept for one more deployment so that pages
+    # already loaded from the previous index.html can still fetch them.
+    current = set(path for root in roots for path in manifest[root])
+    retained, stale = [], []
+    if previous is not None:
+        for root in roots:
+            previous["files"].setdefault(root, {})
+            for path in sorted(set(previous["files"][root]) - current):
+                if assets.is_fingerprinted(path):
+                    retained.append(path)
+                else:
+                    stale.append(path)
+        stale.extend(p for p in previous.get("retained", []) if p not in current)
+
+    def sync_options(local_dir, root):
+        """Returns rsync source, options, and delete flag for changes under root."""
+        if previous is None:
+            return local_dir, "", True
+        files_from = os.path.join(workspace, ".files-{}".format(root))
+        changed = assets.changed_files(manifest[root], previous["files"][root])
+        with open(files_from, "w") as f:
+            f.write("\n".join(changed))
+        return ".", "--files-from='{}'".format(files_from), False
+
+    def remove_stale():
+        """Deletes paths that no longer exist locally from remote_dir."""
+        if stale:
+            log.info("removing {} stale file(s)".format(len(stale)))
+            with cd(remote_dir):
+                run("rm -f -- " + " ".join(quote(path) for path in stale))
+
+    if previous is not None:
+        changed = sum(
+            len(assets.changed_files(manifest[root], previous["files"][root]))
+            for root in roots
         )
+        log.info("{} changed file(s) to deploy".format(changed))
+        if not changed and not stale:
+            rmtree(workspace)
+            return
+
+    if USE_RSYNC_PROJECT:
+
+        def sync(local_dir, root, protect=[]):
+            local_dir, opts, delete = sync_options(local_dir, root)
+            rsync_project(
+                remote_dir=remote_dir,
+                local_dir=local_dir,
+                exclude=exclude + protect,
+                delete=delete,
+                extra_opts="-e 'ssh -l {}' {}".format(conf["user"], opts),
+            )
+
     else:
         exclude = [".git", "fabfile.py", "cache", "config", "*.log", "js", "image"]
-        cmd = "rsync -pthrvz --delete"
+        cmd = "rsync -pthrvz {delete}"
         cmd = (
             cmd
-            + " {exclude} --rsh='ssh  -p 22 ' -e 'ssh -l {user}' {local_dir} {host}:{remote_dir}"
+            + " {exclude} {opts} --rsh='ssh  -p 22 ' -e 'ssh -l {user}' {local_dir} {host}:{remote_dir}"
         )
         cmd_params = {
             "user": conf["user"],
             "host": conf["host"],
             "remote_dir": remote_dir,
-            "exclude": " ".join("--exclude '{}'".format(x) for x in exclude),
         }
 
-        def sync(local_dir):
+        def sync(local_dir, root, protect=[]):
+            local_dir, opts, delete = sync_options(local_dir, root)
+            cmd_params["exclude"] = " ".join(
+                "--exclude '{}'".format(x) for x in exclude + protect
+            )
             cmd_params["local_dir"] = local_dir
+            cmd_params["opts"] = opts
+            cmd_params["delete"] = "--delete" if delete else ""
             local(cmd.format(**cmd_params))
 
     try:
+        # Upload resources before local_dir, which holds index.html, so the
+        # fingerprinted assets a new index.html references are already in place.
+        # The uploaded resources are excluded, and so protected from --delete,
+        # when local_dir is synced.
         with lcd(workspace):
+            sync(local_dir="resources", root="resources")
             with lcd(local_dir):
-                sync(local_dir=".")
-            sync(local_dir="resources")
+                sync(local_dir=".", root=local_dir, protect=["/resources"])
+        remove_stale()
+        assets.save_manifest(manifest_file, {"files": manifest, "retained": retained})
     except:
         log.exception("deployment error:")
         raise
@@ -89,7 +182,9 @@ def deploy_project(local_dir, remote_dir, exclude=[]):
 @task
 def publish():
     """Publishes web implementation and resources to remote server."""
-    deploy_project("web", conf["web_remote_dir"], exclude=ignore + ["template"])
+    deploy_project(
+        "web", conf["web_remote_dir"], exclude=ignore + ["template"], build=True
+    )
 
 
 @task
@@ -26,6 +26,12 @@ class Cinema:
 
 
 class Film:
+    # when the film was first seen, first seen on sale, and first seen sold out;
+    # class level defaults so that films pickled before tracking still load
+    first_seen = None
+    onsale_at = None
+    soldout_at = None
+
     def __init__(
         self,
         session_id,
@@ -78,18 +84,21 @@ def query_pancakes(market_id, overrides):
     """Queries the Alamo Drafthouse API for the list of pancakes in a given market."""
     data = query("{}/{}".format(SHOWTIMES_BASE_URL, market_id))
     market_data = data.get("Market")
-    if log.isEnabledFor(logging.DEBUG):
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
         log.debug("market response:\n%s", format_json(data))
     if not market_data:
         return []
     market_slug = market_data.get("MarketSlug")
     pancakes = []
     for date_data in market_data.get("Dates", []):
-        log.debug("date: %s", date_data.get("Date"))
+        if debug:
+            log.debug("date: %s", date_data.get("Date"))
         for cinema_data in date_data.get("Cinemas", []):
             cinema_name = cinema_data.get("CinemaName")
             cinema_slug = cinema_data.get("CinemaSlug")
-            log.debug("cinema: %s", cinema_name)
+            if debug:
+                log.debug("cinema: %s", cinema_name)
             cinema = Cinema(
                 cinema_data.get("CinemaId"),
                 cinema_slug,
@@ -101,7 +110,8 @@ def query_pancakes(market_id, overrides):
                 film_id = film_data.get("FilmId")
                 film_name = film_data.get("FilmName")
                 film_slug = film_data.get("FilmSlug")
-                log.debug("film: %s", film_name)
+                if debug:
+                    log.debug("film: %s", film_name)
                 if not any(s.lower() in film_name.lower() for s in overrides):
                     if not all(s in film_name.lower() for s in ["pancake"]):
                         continue  # DO NOT WANT!
@@ -109,7 +119,8 @@ def query_pancakes(market_id, overrides):
                     for format_data in series_data.get("Formats", []):
                         for session_data in format_data.get("Sessions", []):
                             session_datetime = session_data.get("SessionDateTime")
-                            log.debug("session: %s", session_datetime)
+                            if debug:
+                                log.debug("session: %s", session_datetime)
                             film_datetime = parse_datetime(
                                 session_datetime, cinema_timezone
                             )
@@ -1,4 +1,29 @@
-from bs4 import BeautifulSoup
+import re
+
+from bs4 import BeautifulSoup, Comment, NavigableString
+
+_WHITESPACE = re.compile(r"\s+")
+_PRESERVE_WHITESPACE_TAGS = ("pre", "textarea", "script", "style")
+_BLOCK_TAGS = (
+    "[document]",
+    "html",
+    "head",
+    "body",
+    "div",
+    "p",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "ul",
+    "ol",
+    "li",
+    "table",
+    "tr",
+    "td",
+)
 
 
 def _apply_style(tag, tag_style):
@@ -9,6 +34,60 @@ def _apply_style(tag, tag_style):
     tag["style"] += s
 
 
+def _parse_style(style_attr):
+    """Helper: Parses an inline style attribute into an ordered dict of declarations."""
+    declarations = {}
+    for declaration in style_attr.split(";"):
+        if ":" not in declaration:
+            continue
+        name, value = declaration.split(":", 1)
+        declarations[name.strip()] = value.strip()
+    return declarations
+
+
+def _apply_compact_style(tag, tag_style):
+    """
+    Helper: Inlines the given tag style to the given tag's style attribute,
+    collapsing repeated declarations and omitting empty style attributes.
+
+    Identical styles shared across tags are deliberately not hoisted into a
+    <style> block: several email clients strip or ignore <style> elements,
+    which is why styles are inlined in the first place.
+    """
+    declarations = _parse_style(tag.get("style", ""))
+    declarations.update(tag_style)
+    if declarations:
+        tag["style"] = ";".join("{}:{}".format(k, v) for k, v in declarations.items())
+    elif "style" in tag.attrs:
+        del tag["style"]
+
+
+def _insignificant_whitespace(text):
+    """
+    Helper: Returns True iff the given whitespace-only text sits at a block-level
+    boundary: the first or last child of a block tag, or next to a block tag.
+    """
+    siblings = (text.previous_sibling, text.next_sibling)
+    if text.parent.name in _BLOCK_TAGS and None in siblings:
+        return True
+    return any(getattr(s, "name", None) in _BLOCK_TAGS for s in siblings)
+
+
+def _minify(soup):
+    """Helper: Strips comments and insignificant whitespace from the given soup."""
+    for text in soup.find_all(string=True):
+        if any(p.name in _PRESERVE_WHITESPACE_TAGS for p in text.parents):
+            continue
+        if isinstance(text, Comment):
+            text.extract()
+        elif type(text) is NavigableString:
+            collapsed = _WHITESPACE.sub(" ", text)
+            if not collapsed.strip() and _insignificant_whitespace(text):
+                text.extract()
+            elif collapsed != text:
+                text.replace_with(collapsed)
+
+
 def _pseudoclass_applies(tag, pseudoclass):
     """Helper: Returns True iff the given pseudo-class name applies to the given tag."""
     # TODO: Support more CSS pseudo-classes.
@@ -78,10 +157,17 @@ def _get_tag_style(tag, style, selectors):
     return tag_style
 
 
-def styled(html, style):
-    """Returns inline CSS styled HTML."""
+def styled(html, style, compact=False):
+    """
+    Returns inline CSS styled HTML. If compact is True, returns minified HTML
+    with repeated declarations within each tag's inline style collapsed,
+    instead of pretty HTML. Every tag still carries its own inline style.
+    """
 
     def as_string(soup):
+        if compact:
+            _minify(soup)
+            return str(soup)
         return str(soup.prettify())
 
     soup = BeautifulSoup(html)
@@ -97,7 +183,8 @@ def styled(html, style):
         if pseudoclass:
             selectors[selector].append(pseudoclass)
 
+    apply_style = _apply_compact_style if compact else _apply_style
     for tag in soup.find_all(True):
-        _apply_style(tag, _get_tag_style(tag, style, selectors))
+        apply_style(tag, _get_tag_style(tag, style, selectors))
 
     return as_string(soup)
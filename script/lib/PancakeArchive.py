@@ -0,0 +1,190 @@
+# License: none (public domain)
+
+import csv
+import gzip
+import io
+import logging
+import os
+from datetime import datetime
+from itertools import groupby
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_FILE_FORMAT = "%Y-%m"
+ARCHIVE_FILE_EXTENSION = ".csv.gz"
+ARCHIVE_FIELDS = [
+    "session_id",
+    "film_id",
+    "film_name",
+    "film_slug",
+    "cinema_id",
+    "cinema_name",
+    "film_datetime",
+    "film_status",
+    "first_seen",
+    "onsale_at",
+    "soldout_at",
+]
+
+
+def _timestamp(dt):
+    """Helper: Returns an ISO 8601 string for the given datetime, or empty for None."""
+    return dt.isoformat() if dt else ""
+
+
+def _parse_timestamp(ts):
+    """Helper: Returns a datetime for the given ISO 8601 string, or None if empty."""
+    return datetime.fromisoformat(ts) if ts else None
+
+
+def archive_record(pancake):
+    """Returns the archive record for the given pancake as a list of fields."""
+    return [
+        pancake.session_id,
+        pancake.film_id,
+        pancake.film_name,
+        pancake.film_slug,
+        pancake.cinema.cinema_id,
+        pancake.cinema.cinema_name,
+        _timestamp(pancake.film_datetime),
+        pancake.film_status,
+        _timestamp(pancake.first_seen),
+        _timestamp(pancake.onsale_at),
+        _timestamp(pancake.soldout_at),
+    ]
+
+
+def archive_filename(directory, dt):
+    """Returns the monthly archive filename for the given show datetime."""
+    name = dt.strftime(ARCHIVE_FILE_FORMAT) + ARCHIVE_FILE_EXTENSION
+    return os.path.join(directory, name)
+
+
+def archive_pancakes(directory, pancakes):
+    """
+    Appends the given pancakes to their monthly compressed archive files and
+    returns the list of pancakes that were archived. Each call appends a new gzip
+    member, so existing data is never rewritten. A month that fails to archive
+    has its partial member truncated away, and is logged and skipped so its
+    pancakes can be retried later.
+    """
+
+    def by_month(p):
+        return archive_filename(directory, p.film_datetime)
+
+    archived = []
+    for filename, pancakes in groupby(sorted(pancakes, key=by_month), key=by_month):
+        pancakes = list(pancakes)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for pancake in pancakes:
+            writer.writerow(archive_record(pancake))
+        log.info("archiving {} pancake(s) to {}".format(len(pancakes), filename))
+        try:
+            with open(filename, "ab") as raw:
+                offset = raw.tell()
+                try:
+                    with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                        f.write(buf.getvalue().encode("utf-8"))
+                    raw.flush()
+                except Exception:
+                    # drop the partial member so the file only holds complete ones
+                    raw.truncate(offset)
+                    raise
+        except Exception as e:
+            log.error("archive failure: {}".format(e))
+            continue
+        archived.extend(pancakes)
+    return archived
+
+
+def archive_files(directory):
+    """Returns sorted list of monthly archive files in the given directory."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(
+        os.path.join(directory, name)
+        for name in names
+        if name.endswith(ARCHIVE_FILE_EXTENSION)
+    )
+
+
+def scan_archive(directory):
+    """
+    Yields archived records, as dicts, one at a time from all archive files.
+    Malformed rows are skipped, and a damaged file is logged and skipped after
+    the records read before the damage.
+    """
+    for filename in archive_files(directory):
+        try:
+            with gzip.open(filename, "rt", encoding="utf-8", newline="") as f:
+                for row in csv.reader(f):
+                    if len(row) == len(ARCHIVE_FIELDS):
+                        yield dict(zip(ARCHIVE_FIELDS, row))
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            log.error("damaged archive file {}: {}".format(filename, e))
+
+
+def archive_stats(directory):
+    """
+    Returns per cinema statistics of archived pancakes, including the latency
+    in hours from when a show was seen on sale until it was seen sold out.
+    Sessions archived more than once, by a retried prune, are only counted once.
+    """
+    stats = {}
+    seen = set()
+    for record in scan_archive(directory):
+        key = (record["session_id"], record["cinema_id"])
+        if key in seen:
+            continue
+        seen.add(key)
+
+        cinema = stats.setdefault(
+            record["cinema_name"],
+            {"shows": 0, "onsale": 0, "soldout": 0, "latencies": 0, "total": 0.0},
+        )
+        cinema["shows"] += 1
+
+        onsale_at = _parse_timestamp(record["onsale_at"])
+        soldout_at = _parse_timestamp(record["soldout_at"])
+        if onsale_at:
+            cinema["onsale"] += 1
+        if soldout_at:
+            cinema["soldout"] += 1
+        if onsale_at and soldout_at:
+            hours = (soldout_at - onsale_at).total_seconds() / 3600
+            cinema["latencies"] += 1
+            cinema["total"] += hours
+            cinema["min"] = min(cinema.get("min", hours), hours)
+            cinema["max"] = max(cinema.get("max", hours), hours)
+
+    for cinema in stats.values():
+        latencies = cinema.pop("latencies")
+        total = cinema.pop("total")
+        cinema["mean"] = total / latencies if latencies else None
+    return stats
+
+
+def stats_string(stats):
+    """Returns a plain text report of the given archive statistics."""
+    if not stats:
+        return "no archived pancakes"
+
+    def hours_string(hours):
+        return "{:.1f}h".format(hours) if hours is not None else "n/a"
+
+    text = ""
+    for cinema_name in sorted(stats):
+        cinema = stats[cinema_name]
+        text += "{}\n".format(cinema_name)
+        text += "shows: {}, seen on sale: {}, seen sold out: {}\n".format(
+            cinema["shows"], cinema["onsale"], cinema["soldout"]
+        )
+        text += "on sale to sold out: mean {}, min {}, max {}\n\n".format(
+            hours_string(cinema["mean"]),
+            hours_string(cinema.get("min")),
+            hours_string(cinema.get("max")),
+        )
+    return text
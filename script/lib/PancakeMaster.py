@@ -16,6 +16,7 @@ from bs4 import BeautifulSoup
 
 import tinycss
 from lib import AlamoDrafthouseAPI as api
+from lib import PancakeArchive as archive
 from lib.InlineCSS import styled
 
 logging.basicConfig()
@@ -23,12 +24,14 @@ log = logging.getLogger(__name__)
 
 RESOURCES_DIRECTORY = "resources"
 PICKLE_FILE = os.path.join(RESOURCES_DIRECTORY, "cache", "pancake.pickle")
+ARCHIVE_DIRECTORY = os.path.join(RESOURCES_DIRECTORY, "cache", "archive")
 RECIPIENTS_FILE = os.path.join(RESOURCES_DIRECTORY, "config", "pancake.list")
 OVERRIDES_FILE = os.path.join(RESOURCES_DIRECTORY, "config", "overrides.list")
 USER_FILE = os.path.join(RESOURCES_DIRECTORY, "config", "user")
 PASS_FILE = os.path.join(RESOURCES_DIRECTORY, "config", "pass")
 STYLE_FILE = os.path.join(RESOURCES_DIRECTORY, "css", "pancake.css")
 TEMPLATE_FILE = os.path.join(RESOURCES_DIRECTORY, "template", "pancake.html")
+WEB_URL = "http://pancake.lexicalunit.com"
 
 DATE_FORMAT = "%A, %B %d, %Y"
 TIME_FORMAT = "%I:%M%p"
@@ -74,8 +77,11 @@ def html_showtimes(pancakes):
     return showtimes
 
 
-def html_digest(pancakes):
-    """Returns pancake styled HTML digest of the given pancakes."""
+def html_digest(pancakes, compact=False, omitted=0):
+    """
+    Returns pancake styled HTML digest of the given pancakes. If compact is True
+    the HTML is minified. A link to the web page is added for omitted showtimes.
+    """
     pancakes = sorted(pancakes, key=pancake_sort_key)
 
     # things to group by
@@ -147,6 +153,15 @@ def html_digest(pancakes):
         soup.append(cinema_heading)
         soup.append(item_list)
 
+    if omitted:
+        more = BeautifulSoup("<p><a></a></p>")
+        assert more.p is not None
+        assert more.a is not None
+        more.p["class"] = "more_showtimes"
+        more.a["href"] = WEB_URL
+        more.a.append(more_showtimes_string(omitted))
+        soup.append(more)
+
     content = str(soup)
 
     # load CSS stylesheet
@@ -165,14 +180,24 @@ def html_digest(pancakes):
     try:
         with open(TEMPLATE_FILE, "r") as f:
             template = f.read()
-        return styled(template.format(content=content), style)
+        return styled(template.format(content=content), style, compact=compact)
     except Exception as e:
         log.warn("could not load HTML template file: {}".format(e))
-        return styled(content, style)
+        return styled(content, style, compact=compact)
+
+
+def more_showtimes_string(omitted):
+    """Returns a notice that the given number of showtimes was left out of a digest."""
+    return "{} more showtime{} at {}".format(
+        omitted, "" if omitted == 1 else "s", WEB_URL
+    )
 
 
-def text_digest(pancakes):
-    """Returns a plain text digest of the given pancakes."""
+def text_digest(pancakes, omitted=0):
+    """
+    Returns a plain text digest of the given pancakes,
+    with a link to the web page for omitted showtimes.
+    """
     text = ""
     for pancake in sorted(pancakes, key=pancake_sort_key):
         if pancake.film_status == "onsale":
@@ -192,29 +217,73 @@ def text_digest(pancakes):
         if pancake.film_status == "onsale":
             text += "\n{}".format(pancake.film_url)
         text += "\n\n"
+    if omitted:
+        text += more_showtimes_string(omitted) + "\n"
     return text
 
 
-def notify(pancakes, recipients):
+def digest_message(pancakes, sender, compact=False, omitted=0):
+    """Returns digest email message of the given pancakes."""
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = "Pancake Master: {}".format(datetime_string(datetime.now()))
+    msg["To"] = "undisclosed-recipients"
+    msg["From"] = sender
+    msg.attach(MIMEText(text_digest(pancakes, omitted), "plain"))
+    msg.attach(MIMEText(html_digest(pancakes, compact, omitted), "html"))
+    return msg
+
+
+def budget_message(pancakes, sender, compact=False, max_size=None):
+    """
+    Returns the digest email message of the given pancakes and its size in bytes.
+    If max_size is given, the digest is truncated to the most showtimes that fit
+    within max_size bytes, with a link to the web page for the rest.
+    """
+    pancakes = sorted(pancakes, key=pancake_sort_key)
+
+    def build(n):
+        msg = digest_message(pancakes[:n], sender, compact, len(pancakes) - n)
+        return msg, len(msg.as_string())
+
+    msg, size = build(len(pancakes))
+    if not max_size or size <= max_size:
+        return msg, size
+
+    # binary search for the largest number of showtimes within budget
+    lo, hi = 0, len(pancakes) - 1
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        candidate = build(mid)
+        if candidate[1] <= max_size:
+            best, lo = candidate, mid + 1
+        else:
+            hi = mid - 1
+
+    if best is None:
+        log.warn("digest exceeds {} bytes even without showtimes".format(max_size))
+        return build(0)
+    return best
+
+
+def notify(pancakes, recipients, compact=False, max_size=None):
     """
     Sends digest email(s) to recipients given pancakes,
-    no email sent if pancakes is empty.
+    no email sent if pancakes is empty. If compact is True the HTML digest is
+    minified, and if max_size is given the digest is truncated to fit that many bytes.
     """
     if not pancakes:
         return
 
-    plain = text_digest(pancakes)
-    log.info("digest:\n{}".format(plain))
+    log.info("digest of {} pancake(s)".format(len(pancakes)))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("digest:\n%s", text_digest(pancakes))
 
     if not recipients:
         return
 
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = "Pancake Master: {}".format(datetime_string(datetime.now()))
-    msg["To"] = "undisclosed-recipients"
-    msg["From"] = recipients[0]
-    msg.attach(MIMEText(plain, "plain"))
-    msg.attach(MIMEText(html_digest(pancakes), "html"))
+    msg, size = budget_message(pancakes, recipients[0], compact, max_size)
+    log.info("digest email size: {} bytes".format(size))
 
     try:
         s = smtplib.SMTP("localhost")
@@ -264,11 +333,26 @@ def load_database():
     return {}
 
 
+def track_status(pancake, previous, now):
+    """Records when the given pancake was first seen, on sale, and sold out."""
+    if previous:
+        pancake.first_seen = previous.first_seen
+        pancake.onsale_at = previous.onsale_at
+        pancake.soldout_at = previous.soldout_at
+    if not pancake.first_seen:
+        pancake.first_seen = now
+    if pancake.film_status == "onsale" and not pancake.onsale_at:
+        pancake.onsale_at = now
+    if pancake.film_status == "soldout" and not pancake.soldout_at:
+        pancake.soldout_at = now
+
+
 def update_pancakes(db, pancakes):
     """
     Updates database given the list of all pancakes,
     returns list of updated pancakes.
     """
+    now = datetime.now()
     updated = []
     for pancake in pancakes:
         key = pancake_key(pancake)
@@ -279,15 +363,30 @@ def update_pancakes(db, pancakes):
         else:
             updated.append(pancake)
 
+        track_status(pancake, db.get(key), now)
         db[key] = pancake
     return updated
 
 
 def prune_database(db):
-    """Removes old pancakes from the database."""
-    for key, pancake in db.items():
-        if pancake.film_datetime.date() < datetime.now().date():
-            del db[key]
+    """
+    Moves old pancakes from the database to the archive,
+    keeping any that could not be archived.
+    """
+    today = datetime.now().date()
+    expired = [k for k, p in db.items() if p.film_datetime.date() < today]
+    if not expired:
+        return
+    try:
+        archived = archive.archive_pancakes(
+            ARCHIVE_DIRECTORY, [db[key] for key in expired]
+        )
+    except Exception:
+        log.exception("archive error:")
+        return
+    # pancakes that failed to archive stay in the database to be retried
+    for pancake in archived:
+        del db[pancake_key(pancake)]
 
 
 def load_user():
@@ -351,10 +450,21 @@ def show_cache():
         log.exception("loading cache:")
 
 
-def main(market, disable_notify=False, disable_fetch=False):
+def show_archive_stats():
+    """Shows on sale and sold out statistics of archived pancakes per cinema."""
+    try:
+        log.info(archive.stats_string(archive.archive_stats(ARCHIVE_DIRECTORY)))
+    except Exception:
+        log.exception("loading archive:")
+
+
+def main(
+    market, disable_notify=False, disable_fetch=False, compact=False, max_size=None
+):
     """Fetches pancake data, send notifications, and reports updates."""
     mkdir_p(os.path.join(RESOURCES_DIRECTORY, "config"))
     mkdir_p(os.path.join(RESOURCES_DIRECTORY, "cache"))
+    mkdir_p(ARCHIVE_DIRECTORY)
 
     db = load_database()
     recipients = load_recipients()
@@ -373,7 +483,7 @@ def main(market, disable_notify=False, disable_fetch=False):
 
     if not disable_notify:
         try:
-            notify(updated, recipients)
+            notify(updated, recipients, compact=compact, max_size=max_size)
         except Exception:
             log.exception("notification error:")
 
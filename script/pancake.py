@@ -1,39 +1,95 @@
 #!/usr/bin/env python
 
 import argparse
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 
 from lib import PancakeMaster as pm
 
 
-def setup_logging(level):
-    """Sets up root logger to log to filename and console simultaneously."""
-    logging.basicConfig(level=level)
+LOG_FILE = "pancake.log"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 5
 
-    fh = logging.FileHandler("pancake.log")
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as single line JSON objects."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues log records with their message merged but their traceback kept
+    separate in exc_text, unlike the standard handler which folds it into msg.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level, json_format=False):
+    """
+    Sets up root logger to log to a rotating file and console simultaneously.
+    Records are queued and written by a background thread, off the hot path.
+    """
+    fh = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+    )
     fh.setLevel(level)
 
     ch = logging.StreamHandler()
     ch.setLevel(level)
 
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
     ch.setFormatter(formatter)
     fh.setFormatter(formatter)
 
+    records = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        records, ch, fh, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
     log = logging.getLogger()
     log.setLevel(level)
 
-    log.addHandler(ch)
-    log.addHandler(fh)
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.addHandler(QueueHandler(records))
     return log
 
 
 if __name__ == "__main__":
-    log = setup_logging(logging.INFO)
-
     usage_help = "Pancake Master searches for new or on sale Master Pancake shows."
     parser = argparse.ArgumentParser(description=usage_help)
     parser.add_argument(
@@ -60,14 +116,50 @@ if __name__ == "__main__":
         action="store_true",
         help="clear database cache before running",
     )
+    parser.add_argument(
+        "--compact",
+        "-c",
+        action="store_true",
+        help="send minified HTML email notifications (styles stay inline per tag)",
+    )
+    parser.add_argument(
+        "--max-email-size",
+        "-s",
+        metavar="BYTES",
+        type=int,
+        default=None,
+        help="truncate email notifications to at most BYTES, linking to the web page",
+    )
     parser.add_argument(
         "--list",
         "-l",
         action="store_true",
         help="list currently cached pancake database",
     )
+    parser.add_argument(
+        "--archive-stats",
+        "-a",
+        action="store_true",
+        help="show on sale to sold out statistics of archived pancakes",
+    )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        help="enable debug logging",
+    )
+    parser.add_argument(
+        "--log-json",
+        "-j",
+        action="store_true",
+        help="write log records as JSON objects",
+    )
     args = parser.parse_args()
 
+    log = setup_logging(
+        logging.DEBUG if args.verbose else logging.INFO, json_format=args.log_json
+    )
+
     if args.clear_cache:
         pm.clear_cache()
 
@@ -75,8 +167,14 @@ if __name__ == "__main__":
         pm.show_cache()
         sys.exit(0)
 
+    if args.archive_stats:
+        pm.show_archive_stats()
+        sys.exit(0)
+
     pm.main(
         args.market,
         disable_notify=args.disable_notify,
         disable_fetch=args.disable_fetch,
+        compact=args.compact,
+        max_size=args.max_email_size,
     )